@@ -10,7 +10,137 @@ from typing import List, Tuple, Dict, Optional
 from datasketch import MinHashLSH
 
 from lsh import create_lsh_index, query_similar
-from utils import filter_by_metadata
+from utils import metadata_mask
+
+
+DIMENSION_NAMES = ['budget', 'revenue', 'runtime', 'popularity', 'vote_average', 'vote_count']
+
+
+def range_mask(data: np.ndarray, positions: np.ndarray,
+               spatial_filters: Dict[str, Tuple[float, float]]) -> np.ndarray:
+    """
+    Boolean mask over positions for rows of data inside every range filter.
+    
+    Only the filtered columns of the selected rows are read from data.
+    
+    Args:
+        data: Numerical data array
+        positions: Row positions to test
+        spatial_filters: Dict mapping dimension names to (min, max) ranges
+        
+    Returns:
+        Boolean array of length len(positions)
+    """
+    mask = np.ones(len(positions), dtype=bool)
+    for dim, (lo, hi) in spatial_filters.items():
+        if dim not in DIMENSION_NAMES:
+            continue
+        column = data[positions, DIMENSION_NAMES.index(dim)]
+        mask &= (column >= lo) & (column <= hi)
+    return mask
+
+
+def _filter_candidates(df: pd.DataFrame, spatial_results: List[int],
+                       metadata_filters: Optional[Dict]) -> pd.DataFrame:
+    """
+    Restrict spatial results to rows passing the metadata filters.
+    
+    The returned frame keeps df's index labels.
+    
+    Args:
+        df: Original DataFrame
+        spatial_results: Row positions returned by the tree
+        metadata_filters: Optional dict of categorical filters
+        
+    Returns:
+        Filtered DataFrame
+    """
+    df_filtered = df.iloc[np.asarray(spatial_results, dtype=np.intp)].copy()
+    if metadata_filters:
+        df_filtered = df_filtered[metadata_mask(df_filtered, metadata_filters)]
+    return df_filtered
+
+
+def _quadtree_positions(quadtree, data: np.ndarray,
+                        spatial_filters: Dict[str, Tuple[float, float]]) -> np.ndarray:
+    """
+    Row positions passing the spatial filters, using a Quadtree.
+    
+    The Quadtree indexes 2D (budget and revenue); the remaining dimensions
+    are checked with range_mask on the rows it returns.
+    
+    Args:
+        quadtree: Built Quadtree
+        data: Numerical data array
+        spatial_filters: Dict mapping dimension names to (min, max) ranges
+        
+    Returns:
+        Array of row positions
+    """
+    x_range = spatial_filters.get('budget', (0, np.inf))
+    y_range = spatial_filters.get('revenue', (0, np.inf))
+    positions = np.asarray(quadtree.query_range(x_range, y_range), dtype=np.intp)
+    
+    other_filters = {dim: spatial_filters[dim]
+                     for dim in ['runtime', 'popularity', 'vote_average', 'vote_count']
+                     if dim in spatial_filters}
+    if other_filters and len(positions):
+        positions = positions[range_mask(data, positions, other_filters)]
+    return positions
+
+
+def spatial_candidates(tree_name: str, tree, data: np.ndarray,
+                       spatial_filters: Dict[str, Tuple[float, float]],
+                       candidate_mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Phase 1 only: row positions passing the spatial filters for one tree.
+    
+    Args:
+        tree_name: 'kdtree', 'range_tree', 'rtree' or 'quadtree'
+        tree: Built tree structure
+        data: Numerical data array
+        spatial_filters: Dict mapping dimension names to (min, max) ranges
+        candidate_mask: Optional boolean mask over rows (e.g. metadata filters) to intersect with
+        
+    Returns:
+        Array of row positions, in the order the tree returned them
+    """
+    if tree_name == 'quadtree':
+        positions = _quadtree_positions(tree, data, spatial_filters)
+    else:
+        ranges = [spatial_filters.get(dim, (0, np.inf)) for dim in DIMENSION_NAMES]
+        positions = np.asarray(tree.range_query(ranges), dtype=np.intp)
+    
+    if candidate_mask is not None:
+        positions = positions[candidate_mask[positions]]
+    return positions
+
+
+def lsh_top_k(df_candidates: pd.DataFrame, text_attribute: str, query_text: str,
+              top_k: int = 10, num_perm: int = 128) -> Tuple[List[int], pd.DataFrame]:
+    """
+    Phase 2 only: top-K textual matches among already filtered rows.
+    
+    Args:
+        df_candidates: Rows that passed spatial and metadata filtering
+        text_attribute: Column name for textual similarity
+        query_text: Text to find similar items to
+        top_k: Number of top similar results to return
+        num_perm: Number of permutations for MinHash
+        
+    Returns:
+        Tuple of (result_indices, result_df)
+    """
+    lsh_index, minhash_dict, df_valid = create_lsh_index(df_candidates, text_attribute, num_perm, verbose=False)
+    
+    if len(df_valid) == 0:
+        return [], df_valid
+    
+    similar_results = query_similar(lsh_index, minhash_dict, df_valid, query_text, top_k, num_perm)
+    
+    # Get actual indices from similar results
+    result_indices = [idx for idx, _ in similar_results]
+    return result_indices, df_valid.loc[result_indices].copy()
 
 
 def query_kdtree_lsh(kdtree, data: np.ndarray, df: pd.DataFrame,
@@ -54,12 +184,8 @@ def query_kdtree_lsh(kdtree, data: np.ndarray, df: pd.DataFrame,
     if not spatial_results:
         return [], pd.DataFrame(), time.time() - start_time, pd.DataFrame()
     
-    # Filter DataFrame by spatial results
-    df_filtered = df.iloc[spatial_results].copy()
-    
-    # Apply metadata filters if provided
-    if metadata_filters:
-        df_filtered = filter_by_metadata(df_filtered, metadata_filters)
+    # Filter DataFrame by spatial results and metadata
+    df_filtered = _filter_candidates(df, spatial_results, metadata_filters)
     
     if len(df_filtered) == 0:
         return [], df_filtered, time.time() - start_time, df_filtered
@@ -112,29 +238,14 @@ def query_quadtree_lsh(quadtree, data: np.ndarray, df: pd.DataFrame,
     import time
     start_time = time.time()
     
-    # Phase 1: Spatial filtering with Quadtree (2D only)
-    x_range = spatial_filters.get('budget', (0, np.inf))
-    y_range = spatial_filters.get('revenue', (0, np.inf))
-    
-    spatial_results = quadtree.query_range(x_range, y_range)
+    # Phase 1: Spatial filtering with Quadtree (2D), then the remaining dimensions
+    spatial_results = _quadtree_positions(quadtree, data, spatial_filters)
     
-    if not spatial_results:
+    if not len(spatial_results):
         return [], pd.DataFrame(), time.time() - start_time, pd.DataFrame()
     
-    # Filter DataFrame by spatial results
-    df_filtered = df.iloc[spatial_results].copy()
-    
-    # Apply additional numerical filters manually (Quadtree only handles 2D)
-    for dim in ['runtime', 'popularity', 'vote_average', 'vote_count']:
-        if dim in spatial_filters:
-            min_val, max_val = spatial_filters[dim]
-            df_filtered = df_filtered[
-                (df_filtered[dim] >= min_val) & (df_filtered[dim] <= max_val)
-            ]
-    
-    # Apply metadata filters if provided
-    if metadata_filters:
-        df_filtered = filter_by_metadata(df_filtered, metadata_filters)
+    # Filter DataFrame by spatial results and metadata
+    df_filtered = _filter_candidates(df, spatial_results, metadata_filters)
     
     if len(df_filtered) == 0:
         return [], df_filtered, time.time() - start_time, df_filtered
@@ -199,12 +310,8 @@ def query_rangetree_lsh(range_tree, data: np.ndarray, df: pd.DataFrame,
     if not spatial_results:
         return [], pd.DataFrame(), time.time() - start_time, pd.DataFrame()
     
-    # Filter DataFrame by spatial results
-    df_filtered = df.iloc[spatial_results].copy()
-    
-    # Apply metadata filters if provided
-    if metadata_filters:
-        df_filtered = filter_by_metadata(df_filtered, metadata_filters)
+    # Filter DataFrame by spatial results and metadata
+    df_filtered = _filter_candidates(df, spatial_results, metadata_filters)
     
     if len(df_filtered) == 0:
         return [], df_filtered, time.time() - start_time, df_filtered
@@ -269,12 +376,8 @@ def query_rtree_lsh(rtree, data: np.ndarray, df: pd.DataFrame,
     if not spatial_results:
         return [], pd.DataFrame(), time.time() - start_time, pd.DataFrame()
     
-    # Filter DataFrame by spatial results
-    df_filtered = df.iloc[spatial_results].copy()
-    
-    # Apply metadata filters if provided
-    if metadata_filters:
-        df_filtered = filter_by_metadata(df_filtered, metadata_filters)
+    # Filter DataFrame by spatial results and metadata
+    df_filtered = _filter_candidates(df, spatial_results, metadata_filters)
     
     if len(df_filtered) == 0:
         return [], df_filtered, time.time() - start_time, df_filtered
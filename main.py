@@ -9,7 +9,7 @@ import pandas as pd
 from typing import Dict, List, Tuple
 import sys
 
-from utils import load_movies_dataset, preprocess_data
+from utils import load_or_build
 from kdtree import KDTree
 from range_tree import SimpleRangeTree
 from rtree import SimpleRTree
@@ -155,16 +155,14 @@ def main():
     
     # Load and preprocess data
     print_section("Loading and Preprocessing Data")
+    dimensions = ['budget', 'revenue', 'runtime', 'popularity', 'vote_average', 'vote_count']
     try:
-        df = load_movies_dataset()
+        data, df_clean = load_or_build(dimensions=dimensions)
     except Exception as e:
         print(f"Error loading dataset: {e}")
         print("\nMake sure 'data_movies_clean.csv' is in the same folder as this script!")
         sys.exit(1)
     
-    data, df_clean = preprocess_data(df)
-    dimensions = ['budget', 'revenue', 'runtime', 'popularity', 'vote_average', 'vote_count']
-    
     # Build trees
     try:
         trees, build_times = build_trees(data, df_clean, dimensions)
@@ -8,12 +8,17 @@ import pandas as pd
 from typing import Dict, List, Tuple
 import time
 
-from combined_queries import (
-    query_kdtree_lsh,
-    query_rangetree_lsh,
-    query_rtree_lsh,
-    query_quadtree_lsh
-)
+from utils import metadata_mask
+from combined_queries import spatial_candidates, lsh_top_k
+
+
+# Tree name -> display label, in the order the methods are run
+TREE_METHODS = {
+    'kdtree': "K-D Tree",
+    'range_tree': "Range Tree",
+    'rtree': "R-Tree",
+    'quadtree': "Quadtree",
+}
 
 
 def display_spatial_results(df_filtered, n_top, tree_name):
@@ -22,22 +27,54 @@ def display_spatial_results(df_filtered, n_top, tree_name):
     print(f"Found {len(df_filtered)} movies matching spatial criteria")
     print(f"\nFirst {n_top} movies:")
     
-    for i, (idx, row) in enumerate(df_filtered.head(n_top).iterrows()):
+    # Pull each column out once instead of building a Series per row
+    head = df_filtered.head(n_top)
+    columns = zip(
+        head['title'].to_numpy(),
+        head['release_date'].tolist(),
+        head['production_company_names'].to_numpy(),
+        head['genre_names'].to_numpy(),
+        head['runtime'].to_numpy(),
+        head['popularity'].to_numpy(),
+        head['vote_average'].to_numpy(),
+        head['origin_country'].to_numpy(),
+        head['original_language'].to_numpy()
+    )
+    
+    for i, (title, release_date, companies, genres, runtime,
+            popularity, vote_average, country, language) in enumerate(columns):
         # Handle release_date which might be a string or Timestamp
         release_year = 'N/A'
-        if pd.notna(row['release_date']):
-            release_date_str = str(row['release_date'])
+        if pd.notna(release_date):
+            release_date_str = str(release_date)
             if len(release_date_str) >= 4:
                 release_year = release_date_str[:4]
         
-        print(f"\n{i+1}. {row['title']} ({release_year})")
-        print(f"   Production Companies: {row['production_company_names']}")
-        print(f"   Genres: {row['genre_names']}")
-        print(f"   Runtime: {row['runtime']:.0f} min")
-        print(f"   Popularity: {row['popularity']:.2f}")
-        print(f"   Vote Average: {row['vote_average']:.2f}")
-        print(f"   Country: {row['origin_country']}")
-        print(f"   Language: {row['original_language']}")
+        print(f"\n{i+1}. {title} ({release_year})")
+        print(f"   Production Companies: {companies}")
+        print(f"   Genres: {genres}")
+        print(f"   Runtime: {runtime:.0f} min")
+        print(f"   Popularity: {popularity:.2f}")
+        print(f"   Vote Average: {vote_average:.2f}")
+        print(f"   Country: {country}")
+        print(f"   Language: {language}")
+
+
+def print_query_summary(results: Dict, n_top: int):
+    """Print per-tree result counts and query times."""
+    print("\n" + "=" * 80)
+    print("  QUERY SUMMARY")
+    print("=" * 80)
+    print(f"\nParameter N = {n_top} (user-defined)")
+    print("\nTree Performance:")
+    for tree_name in TREE_METHODS:
+        if tree_name in results and 'error' not in results[tree_name]:
+            print(f"  {tree_name:12}: {results[tree_name]['count']:3d} results in {results[tree_name]['time']:.4f}s"
+                  f" (spatial {results[tree_name]['spatial_time']:.4f}s)")
+        elif tree_name in results:
+            print(f"  {tree_name:12}: Error")
+        else:
+            print(f"  {tree_name:12}: Skipped")
 
 
 def run_project_query(trees: Dict, data: np.ndarray, df: pd.DataFrame,
@@ -104,177 +141,114 @@ def run_project_query(trees: Dict, data: np.ndarray, df: pd.DataFrame,
             'original_language': 'en'
         }
     
-    results = {}
+    # Metadata filters are identical for every tree: evaluate them once
+    common_mask = metadata_mask(df, metadata_filters)
     
-    # Query with K-D Tree + LSH
-    if 'kdtree' in trees:
-        print("\n" + "-" * 80)
-        print("Method 1: K-D Tree + LSH")
-        print("-" * 80)
-        try:
-            indices, result_df, query_time, df_spatial = query_kdtree_lsh(
-                trees['kdtree'], data, df,
-                spatial_filters, text_attribute, query_text,
-                metadata_filters, top_k=n_top
-            )
-            
-            # Display spatial filtering results BEFORE LSH
-            if len(df_spatial) > 0:
-                display_spatial_results(df_spatial, min(5, n_top), "K-D Tree")
-            
-            print(f"\nNow applying LSH for text similarity...")
-            print(f"Query time: {query_time:.4f}s")
-            print(f"Results found: {len(result_df)}")
-            
-            if len(result_df) > 0:
-                print(f"\nTop N={n_top} results:")
-                for i, (idx, row) in enumerate(result_df.iterrows(), 1):
-                    print(f"\n  {i}. {row['title']}")
-                    print(f"     {text_attribute}: {row[text_attribute]}")
-                    print(f"     Release: {row['release_date']}")
-                    print(f"     Rating: {row['vote_average']:.1f}")
-                    print(f"     Runtime: {row['runtime']:.0f} min")
-                    print(f"     Popularity: {row['popularity']:.1f}")
-            else:
-                print("  No results found with these filters")
-            
-            results['kdtree'] = {
-                'indices': indices,
-                'dataframe': result_df,
-                'time': query_time,
-                'count': len(result_df)
-            }
-            
-        except Exception as e:
-            print(f"  Error: {str(e)}")
-            results['kdtree'] = {'error': str(e)}
+    # Nothing can match: skip all tree traversals and LSH indexing
+    if not common_mask.any():
+        print("\nNo candidates match filters")
+        results = {
+            tree_name: {'indices': [], 'dataframe': df.iloc[[]], 'time': 0.0,
+                        'spatial_time': 0.0, 'count': 0}
+            for tree_name in TREE_METHODS
+            if tree_name in trees
+        }
+        print_query_summary(results, n_top)
+        return results
     
-    # Query with Range Tree + LSH
-    if 'range_tree' in trees:
-        print("\n" + "-" * 80)
-        print("Method 2: Range Tree + LSH")
-        print("-" * 80)
-        try:
-            indices, result_df, query_time, df_spatial = query_rangetree_lsh(
-                trees['range_tree'], data, df,
-                spatial_filters, text_attribute, query_text,
-                metadata_filters, top_k=n_top
-            )
-            
-            # Display spatial filtering results BEFORE LSH
-            if len(df_spatial) > 0:
-                display_spatial_results(df_spatial, min(5, n_top), "Range Tree")
-            
-            print(f"\nNow applying LSH for text similarity...")
-            print(f"Query time: {query_time:.4f}s")
-            print(f"Results found: {len(result_df)}")
-            
-            if len(result_df) > 0:
-                print(f"\nTop N={n_top} results:")
-                for i, (idx, row) in enumerate(result_df.iterrows(), 1):
-                    print(f"  {i}. {row['title']} - {row[text_attribute]}")
-            else:
-                print("  No results found with these filters")
-            
-            results['range_tree'] = {
-                'indices': indices,
-                'dataframe': result_df,
-                'time': query_time,
-                'count': len(result_df)
-            }
-            
-        except Exception as e:
-            print(f"  Error: {str(e)}")
-            results['range_tree'] = {'error': str(e)}
+    results = {}
     
-    # Query with R-Tree + LSH
-    if 'rtree' in trees:
-        print("\n" + "-" * 80)
-        print("Method 3: R-Tree + LSH")
-        print("-" * 80)
+    # Phase 1 per tree: the trees differ only in how they do the spatial pruning
+    candidates = {}
+    for tree_name in TREE_METHODS:
+        if tree_name not in trees:
+            continue
         try:
-            indices, result_df, query_time, df_spatial = query_rtree_lsh(
-                trees['rtree'], data, df,
-                spatial_filters, text_attribute, query_text,
-                metadata_filters, top_k=n_top
+            start = time.time()
+            candidates[tree_name] = spatial_candidates(
+                tree_name, trees[tree_name], data, spatial_filters, common_mask
             )
-            
-            # Display spatial filtering results BEFORE LSH
-            if len(df_spatial) > 0:
-                display_spatial_results(df_spatial, min(5, n_top), "R-Tree")
-            
-            print(f"\nNow applying LSH for text similarity...")
-            print(f"Query time: {query_time:.4f}s")
-            print(f"Results found: {len(result_df)}")
-            
-            if len(result_df) > 0:
-                print(f"\nTop N={n_top} results:")
-                for i, (idx, row) in enumerate(result_df.iterrows(), 1):
-                    print(f"  {i}. {row['title']} - {row[text_attribute]}")
-            else:
-                print("  No results found with these filters")
-            
-            results['rtree'] = {
-                'indices': indices,
-                'dataframe': result_df,
-                'time': query_time,
-                'count': len(result_df)
-            }
-            
+            results[tree_name] = {'spatial_time': time.time() - start}
         except Exception as e:
-            print(f"  Error: {str(e)}")
-            results['rtree'] = {'error': str(e)}
+            results[tree_name] = {'error': str(e)}
     
-    # Query with Quadtree + LSH
-    if 'quadtree' in trees:
+    # Phase 2 once per distinct candidate set (normally one set shared by all trees)
+    lsh_results = {}
+    for method_num, (tree_name, label) in enumerate(TREE_METHODS.items(), 1):
+        if tree_name not in candidates:
+            if tree_name in results:
+                print("\n" + "-" * 80)
+                print(f"Method {method_num}: {label} + LSH")
+                print("-" * 80)
+                print(f"  Error: {results[tree_name]['error']}")
+            continue
+        
         print("\n" + "-" * 80)
-        print("Method 4: Quadtree + LSH")
+        print(f"Method {method_num}: {label} + LSH")
         print("-" * 80)
         try:
-            indices, result_df, query_time, df_spatial = query_quadtree_lsh(
-                trees['quadtree'], data, df,
-                spatial_filters, text_attribute, query_text,
-                metadata_filters, top_k=n_top
-            )
+            positions = candidates[tree_name]
+            df_spatial = df.iloc[positions]
             
             # Display spatial filtering results BEFORE LSH
             if len(df_spatial) > 0:
-                display_spatial_results(df_spatial, min(5, n_top), "Quadtree")
-            
-            print(f"\nNow applying LSH for text similarity...")
+                display_spatial_results(df_spatial, min(5, n_top), label)
+            
+            key = np.sort(positions).tobytes()
+            shared = key in lsh_results
+            if not shared:
+                start = time.time()
+                indices, result_df = (lsh_top_k(df_spatial, text_attribute, query_text, n_top)
+                                      if len(df_spatial) > 0 else ([], df_spatial))
+                lsh_results[key] = (indices, result_df, time.time() - start)
+            indices, result_df, lsh_time = lsh_results[key]
+            
+            spatial_time = results[tree_name]['spatial_time']
+            query_time = spatial_time + lsh_time
+            print(f"\nNow applying LSH for text similarity..."
+                  + (" (shared with previous tree)" if shared else ""))
+            print(f"Spatial time: {spatial_time:.4f}s")
             print(f"Query time: {query_time:.4f}s")
             print(f"Results found: {len(result_df)}")
             
             if len(result_df) > 0:
                 print(f"\nTop N={n_top} results:")
-                for i, (idx, row) in enumerate(result_df.iterrows(), 1):
-                    print(f"  {i}. {row['title']} - {row[text_attribute]}")
+                if tree_name == 'kdtree':
+                    columns = zip(
+                        result_df['title'].to_numpy(),
+                        result_df[text_attribute].to_numpy(),
+                        result_df['release_date'].tolist(),
+                        result_df['vote_average'].to_numpy(),
+                        result_df['runtime'].to_numpy(),
+                        result_df['popularity'].to_numpy()
+                    )
+                    for i, (title, text, release_date, vote_average,
+                            runtime, popularity) in enumerate(columns, 1):
+                        print(f"\n  {i}. {title}")
+                        print(f"     {text_attribute}: {text}")
+                        print(f"     Release: {release_date}")
+                        print(f"     Rating: {vote_average:.1f}")
+                        print(f"     Runtime: {runtime:.0f} min")
+                        print(f"     Popularity: {popularity:.1f}")
+                else:
+                    for i, (title, text) in enumerate(zip(result_df['title'].to_numpy(),
+                                                          result_df[text_attribute].to_numpy()), 1):
+                        print(f"  {i}. {title} - {text}")
             else:
                 print("  No results found with these filters")
             
-            results['quadtree'] = {
+            results[tree_name] = {
                 'indices': indices,
                 'dataframe': result_df,
                 'time': query_time,
+                'spatial_time': spatial_time,
                 'count': len(result_df)
             }
             
         except Exception as e:
             print(f"  Error: {str(e)}")
-            results['quadtree'] = {'error': str(e)}
+            results[tree_name] = {'error': str(e)}
     
-    # Summary
-    print("\n" + "=" * 80)
-    print("  QUERY SUMMARY")
-    print("=" * 80)
-    print(f"\nParameter N = {n_top} (user-defined)")
-    print("\nTree Performance:")
-    for tree_name in ['kdtree', 'range_tree', 'rtree', 'quadtree']:
-        if tree_name in results and 'error' not in results[tree_name]:
-            print(f"  {tree_name:12}: {results[tree_name]['count']:3d} results in {results[tree_name]['time']:.4f}s")
-        elif tree_name in results:
-            print(f"  {tree_name:12}: Error")
-        else:
-            print(f"  {tree_name:12}: Skipped")
+    print_query_summary(results, n_top)
     
     return results
\ No newline at end of file
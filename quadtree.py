@@ -6,6 +6,83 @@ import numpy as np
 from typing import List, Tuple, Optional
 
 
+def _range_flat(bounds: np.ndarray, children: np.ndarray, node_ranges: np.ndarray,
+                all_xs: np.ndarray, all_ys: np.ndarray, all_idxs: np.ndarray,
+                q: np.ndarray) -> np.ndarray:
+    """
+    Range query over a flattened Quadtree using an explicit stack.
+    
+    Args:
+        bounds: (n_nodes, 4) array of node (x_min, x_max, y_min, y_max)
+        children: (n_nodes, 4) array of child node ids (NW, NE, SW, SE), -1 for leaves
+        node_ranges: (n_nodes, 3) array of (start, own_end, subtree_end) offsets into
+            the point arrays; [start, own_end) are the node's own points and
+            [start, subtree_end) are all points below it
+        all_xs: X coordinates of all points, in depth-first node order
+        all_ys: Y coordinates of all points, in depth-first node order
+        all_idxs: Original indices of all points, in depth-first node order
+        q: Query (x_min, x_max, y_min, y_max)
+        
+    Returns:
+        Array of indices of points in range
+    """
+    out = np.empty(len(all_idxs), dtype=np.int32)
+    count = 0
+    stack = np.empty(3 * len(bounds) + 1, dtype=np.int32)
+    top = 0
+    stack[top] = 0
+    top += 1
+    
+    while top > 0:
+        top -= 1
+        node = stack[top]
+        
+        # Skip nodes whose bounds don't intersect the query
+        if (q[1] < bounds[node, 0] or q[0] > bounds[node, 1] or
+                q[3] < bounds[node, 2] or q[2] > bounds[node, 3]):
+            continue
+        
+        # Node entirely inside the query: emit its whole subtree without comparisons
+        if (q[0] <= bounds[node, 0] and q[1] >= bounds[node, 1] and
+                q[2] <= bounds[node, 2] and q[3] >= bounds[node, 3]):
+            for i in range(node_ranges[node, 0], node_ranges[node, 2]):
+                out[count] = all_idxs[i]
+                count += 1
+            continue
+        
+        for i in range(node_ranges[node, 0], node_ranges[node, 1]):
+            if q[0] <= all_xs[i] <= q[1] and q[2] <= all_ys[i] <= q[3]:
+                out[count] = all_idxs[i]
+                count += 1
+        
+        if children[node, 0] >= 0:
+            for c in range(3, -1, -1):
+                stack[top] = children[node, c]
+                top += 1
+    
+    return out[:count]
+
+
+_range_flat_compiled = None
+
+
+def _compiled_range_flat():
+    """
+    Compile _range_flat with numba on first use (numba also caches it on disk).
+    
+    Returns:
+        The compiled kernel, or None if numba is not installed
+    """
+    global _range_flat_compiled
+    if _range_flat_compiled is None:
+        try:
+            from numba import njit
+        except ImportError:  # numba is optional; use_numba falls back to node traversal
+            return None
+        _range_flat_compiled = njit(cache=True)(_range_flat)
+    return _range_flat_compiled
+
+
 class QuadtreeNode:
     """Node in a Quadtree."""
     
@@ -26,7 +103,12 @@ class QuadtreeNode:
         self.y_max = y_max
         self.capacity = capacity
         
-        self.points = []  # List of (x, y, index, full_data) tuples - now stores full 6D data
+        # Leaf points stored as parallel arrays (allocated lazily on first insert)
+        self.n = 0
+        self.xs = None    # x coordinates
+        self.ys = None    # y coordinates
+        self.idxs = None  # original indices (full rows live in Quadtree.data)
+        self.all_idxs = None  # Indices of every point in this subtree (set by Quadtree)
         self.is_divided = False
         
         # Children nodes (NW, NE, SW, SE)
@@ -45,8 +127,28 @@ class QuadtreeNode:
         return not (x_max < self.x_min or x_min > self.x_max or
                    y_max < self.y_min or y_min > self.y_max)
     
-    def subdivide(self):
-        """Split this node into four quadrants."""
+    def _allocate(self, size: int):
+        """Allocate empty leaf buffers able to hold `size` points."""
+        self.xs = np.empty(size, dtype=np.float32)
+        self.ys = np.empty(size, dtype=np.float32)
+        self.idxs = np.empty(size, dtype=np.int32)
+    
+    def _grow(self):
+        """Double the leaf buffers (capped at node capacity)."""
+        size = min(max(2 * len(self.xs), 1), self.capacity)
+        self.xs = np.resize(self.xs, size)
+        self.ys = np.resize(self.ys, size)
+        self.idxs = np.resize(self.idxs, size)
+    
+    def _set_points(self, xs: np.ndarray, ys: np.ndarray, idxs: np.ndarray):
+        """Load a batch of points (already known to lie in this node) into the leaf."""
+        self.n = len(xs)
+        self.xs = xs.copy()
+        self.ys = ys.copy()
+        self.idxs = idxs.copy()
+    
+    def _make_children(self) -> Tuple[float, float]:
+        """Create the four empty child quadrants and return the split point."""
         x_mid = (self.x_min + self.x_max) / 2
         y_mid = (self.y_min + self.y_max) / 2
         
@@ -57,30 +159,38 @@ class QuadtreeNode:
         self.se = QuadtreeNode(x_mid, self.x_max, self.y_min, y_mid, self.capacity)
         
         self.is_divided = True
+        return x_mid, y_mid
+    
+    def subdivide(self):
+        """Split this node into four quadrants."""
+        x_mid, y_mid = self._make_children()
         
-        # Redistribute existing points to children
-        for point in self.points:
-            self._insert_to_child(point)
+        # Redistribute existing points to children (ties go NW, NE, SW, SE in order)
+        # Compare in float64: a float32 comparison would round the split point first
+        n = self.n
+        xs, ys, idxs = self.xs[:n], self.ys[:n], self.idxs[:n]
+        west = xs.astype(np.float64) <= x_mid
+        north = ys.astype(np.float64) >= y_mid
+        for child, quadrant in ((self.nw, north & west), (self.ne, north & ~west),
+                                (self.sw, ~north & west), (self.se, ~north & ~west)):
+            if quadrant.any():
+                child._set_points(xs[quadrant], ys[quadrant], idxs[quadrant])
         
         # Clear points from this node
-        self.points = []
+        self.n = 0
+        self.xs = self.ys = self.idxs = None
     
-    def _insert_to_child(self, point: Tuple) -> bool:
-        """Insert a point into the appropriate child."""
-        x, y, idx, full_data = point
-        
-        if self.nw.contains(x, y):
-            return self.nw.insert(x, y, idx, full_data)
-        elif self.ne.contains(x, y):
-            return self.ne.insert(x, y, idx, full_data)
-        elif self.sw.contains(x, y):
-            return self.sw.insert(x, y, idx, full_data)
-        elif self.se.contains(x, y):
-            return self.se.insert(x, y, idx, full_data)
-        
-        return False
+    def _insert_to_child(self, x: float, y: float, idx: int) -> bool:
+        """Insert a point (known to lie in this node) into the appropriate child."""
+        # Pick the quadrant from the split point; same ties as contains(): NW, NE, SW, SE
+        west = x <= self.nw.x_max
+        if y >= self.nw.y_min:
+            child = self.nw if west else self.ne
+        else:
+            child = self.sw if west else self.se
+        return child._insert_xy_idx(x, y, idx)
     
-    def insert(self, x: float, y: float, index: int, full_data: Optional[np.ndarray] = None) -> bool:
+    def insert(self, x: float, y: float, index: int) -> bool:
         """
         Insert a point into the quadtree.
         
@@ -88,18 +198,34 @@ class QuadtreeNode:
             x: X coordinate (first dimension)
             y: Y coordinate (second dimension)
             index: Original index in dataset
-            full_data: Full 6D data point (optional, for filtering other dimensions)
             
         Returns:
             True if insertion successful
         """
-        # Check if point is in bounds
+        # Decide on the float32 value the leaf will store, as a Python float
+        x, y = float(np.float32(x)), float(np.float32(y))
+        
+        # Check if point is in bounds (once; descendants are chosen by quadrant)
         if not self.contains(x, y):
             return False
         
+        return self._insert_xy_idx(x, y, index)
+    
+    def _insert_xy_idx(self, x: float, y: float, index: int) -> bool:
+        """Insert a point already known to lie within this node's bounds."""
+        # Subtree contents are changing
+        self.all_idxs = None
+        
         # If node has capacity and is not divided, add point
-        if not self.is_divided and len(self.points) < self.capacity:
-            self.points.append((x, y, index, full_data))
+        if not self.is_divided and self.n < self.capacity:
+            if self.xs is None:
+                self._allocate(min(8, self.capacity))
+            elif self.n == len(self.xs):
+                self._grow()
+            self.xs[self.n] = x
+            self.ys[self.n] = y
+            self.idxs[self.n] = index
+            self.n += 1
             return True
         
         # If node is at capacity, subdivide
@@ -107,7 +233,7 @@ class QuadtreeNode:
             self.subdivide()
         
         # Insert into appropriate child
-        return self._insert_to_child((x, y, index, full_data))
+        return self._insert_to_child(x, y, index)
     
     def query_range(self, x_min: float, x_max: float, 
                    y_min: float, y_max: float) -> List[int]:
@@ -129,17 +255,28 @@ class QuadtreeNode:
         if not self.intersects(x_min, x_max, y_min, y_max):
             return results
         
-        # Check points in this node
-        for x, y, idx, full_data in self.points:
-            if x_min <= x <= x_max and y_min <= y <= y_max:
-                results.append(idx)
-        
-        # Recursively check children
-        if self.is_divided:
-            results.extend(self.nw.query_range(x_min, x_max, y_min, y_max))
-            results.extend(self.ne.query_range(x_min, x_max, y_min, y_max))
-            results.extend(self.sw.query_range(x_min, x_max, y_min, y_max))
-            results.extend(self.se.query_range(x_min, x_max, y_min, y_max))
+        # Explicit-stack traversal; children disjoint from the range are never pushed
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            
+            # Node entirely inside the range: take its whole subtree
+            if (node.all_idxs is not None and
+                    x_min <= node.x_min and x_max >= node.x_max and
+                    y_min <= node.y_min and y_max >= node.y_max):
+                results.extend(node.all_idxs.tolist())
+                continue
+            
+            # Check points in this node (vectorized over the leaf arrays)
+            if node.n:
+                xs, ys = node.xs[:node.n], node.ys[:node.n]
+                m = (xs >= x_min) & (xs <= x_max) & (ys >= y_min) & (ys <= y_max)
+                results.extend(node.idxs[:node.n][m].tolist())
+            
+            if node.is_divided:
+                for child in (node.se, node.sw, node.ne, node.nw):
+                    if child.intersects(x_min, x_max, y_min, y_max):
+                        stack.append(child)
         
         return results
     
@@ -164,7 +301,8 @@ class Quadtree:
     Quadtree for 2D spatial indexing.
     """
     
-    def __init__(self, x_dim: int = 0, y_dim: int = 1, capacity: int = 50):
+    def __init__(self, x_dim: int = 0, y_dim: int = 1, capacity: int = 50,
+                 max_depth: int = 25, use_numba: bool = False):
         """
         Initialize a Quadtree.
         
@@ -172,31 +310,48 @@ class Quadtree:
             x_dim: Index of dimension to use for x-axis
             y_dim: Index of dimension to use for y-axis
             capacity: Maximum points per node before splitting
+            max_depth: Depth at which nodes stop splitting during build
+            use_numba: Answer range queries with the numba-compiled flat kernel.
+                It is compiled (or loaded from numba's cache) during build(), which
+                costs 0.2-0.8s per process, so it only pays off for many queries
         """
         self.x_dim = x_dim
         self.y_dim = y_dim
         self.capacity = capacity
+        self.max_depth = max_depth
+        self.use_numba = use_numba
+        self._range_kernel = None  # Compiled _range_flat when use_numba (see build)
         self.root = None
+        self.data = None  # Points passed to build(); full rows are data[idx]
         self.size = 0
+        self._flat = None  # Flattened node/point arrays (see _flatten)
     
     def build(self, points: np.ndarray, indices: Optional[np.ndarray] = None):
         """
         Build the Quadtree from a set of points.
         
+        Points are bulk-loaded: each level partitions an index array by
+        quadrant with NumPy masks, and leaves receive contiguous slices of
+        the partitioned coordinate arrays.
+        
         Args:
-            points: Array of shape (n_points, n_dimensions) - stores full 6D but indexes on 2D
+            points: Array of shape (n_points, n_dimensions) - indexes on 2D; the
+                array is kept as self.data so full rows can be looked up by index
             indices: Optional array of original indices
         """
+        self.data = points
         if indices is None:
             indices = np.arange(len(points))
+        indices = np.asarray(indices)
         
-        # Extract 2D coordinates for spatial indexing (budget and revenue)
-        x_coords = points[:, self.x_dim]
-        y_coords = points[:, self.y_dim]
+        # Extract 2D coordinates for spatial indexing (budget and revenue); partition
+        # on the stored float32 values, compared in float64 against the split points
+        x_coords = points[:, self.x_dim].astype(np.float32).astype(np.float64)
+        y_coords = points[:, self.y_dim].astype(np.float32).astype(np.float64)
         
-        # Determine bounds with small padding
-        x_min, x_max = x_coords.min(), x_coords.max()
-        y_min, y_max = y_coords.min(), y_coords.max()
+        # Determine bounds with small padding (kept as Python floats)
+        x_min, x_max = float(x_coords.min()), float(x_coords.max())
+        y_min, y_max = float(y_coords.min()), float(y_coords.max())
         
         # Add small padding to ensure all points fit
         x_padding = (x_max - x_min) * 0.01
@@ -206,11 +361,143 @@ class Quadtree:
                                 y_min - y_padding, y_max + y_padding,
                                 self.capacity)
         
-        # Insert all points with full 6D data
-        for i, idx in enumerate(indices):
-            full_data = points[i] if points.shape[1] > 2 else None
-            self.root.insert(x_coords[i], y_coords[i], idx, full_data)
-            self.size += 1
+        # Partition positions into quadrant order, collecting (leaf, start, end)
+        order = np.arange(len(points))
+        leaves = []
+        self._bulk(self.root, order, 0, len(order), x_coords, y_coords, 1, leaves)
+        
+        # Gather once in partitioned order; leaves keep views of their slice
+        xs = x_coords[order].astype(np.float32)
+        ys = y_coords[order].astype(np.float32)
+        idxs = indices[order].astype(np.int32)
+        for leaf, start, end in leaves:
+            leaf.n = end - start
+            leaf.xs = xs[start:end]
+            leaf.ys = ys[start:end]
+            leaf.idxs = idxs[start:end]
+        
+        self.size += len(points)
+        self._flat = self._flatten()
+        
+        if self.use_numba:
+            # JIT up front so the compile is not charged to the first query
+            self._range_kernel = _compiled_range_flat()
+            if self._range_kernel is not None:
+                self._range_kernel(*self._flat, np.zeros(4, dtype=np.float32))
+    
+    def _flatten(self) -> Tuple[np.ndarray, ...]:
+        """
+        Flatten the tree into parallel arrays (depth-first node order).
+        
+        Depth-first order keeps every subtree's points contiguous, so each
+        node's all_idxs is set to a view of its slice of all_idxs.
+        
+        Returns:
+            Tuple of (bounds, children, node_ranges, all_xs, all_ys, all_idxs)
+        """
+        nodes = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            if node.is_divided:
+                stack.extend((node.se, node.sw, node.ne, node.nw))
+        
+        n_nodes = len(nodes)
+        node_ids = {id(node): i for i, node in enumerate(nodes)}
+        bounds = np.empty((n_nodes, 4), dtype=np.float64)
+        children = np.full((n_nodes, 4), -1, dtype=np.int32)
+        node_ranges = np.zeros((n_nodes, 3), dtype=np.int64)
+        xs_parts, ys_parts, idxs_parts = [], [], []
+        
+        offset = 0
+        for i, node in enumerate(nodes):
+            bounds[i] = (node.x_min, node.x_max, node.y_min, node.y_max)
+            if node.is_divided:
+                children[i] = [node_ids[id(c)] for c in (node.nw, node.ne, node.sw, node.se)]
+            node_ranges[i, 0] = offset
+            if node.n:
+                xs_parts.append(node.xs[:node.n])
+                ys_parts.append(node.ys[:node.n])
+                idxs_parts.append(node.idxs[:node.n])
+                offset += node.n
+            node_ranges[i, 1] = offset
+        
+        # Subtree end is the end of the last (SE) child's subtree
+        for i in range(n_nodes - 1, -1, -1):
+            last = children[i, 3]
+            node_ranges[i, 2] = node_ranges[last, 2] if last >= 0 else node_ranges[i, 1]
+        
+        if offset == 0:
+            all_xs = np.empty(0, dtype=np.float32)
+            all_ys = np.empty(0, dtype=np.float32)
+            all_idxs = np.empty(0, dtype=np.int32)
+        else:
+            all_xs = np.concatenate(xs_parts)
+            all_ys = np.concatenate(ys_parts)
+            all_idxs = np.concatenate(idxs_parts).astype(np.int32)
+        
+        for i, node in enumerate(nodes):
+            node.all_idxs = all_idxs[node_ranges[i, 0]:node_ranges[i, 2]]
+        
+        return bounds, children, node_ranges, all_xs, all_ys, all_idxs
+    
+    def insert(self, x: float, y: float, index: int) -> bool:
+        """
+        Insert a single point after the tree has been built.
+        
+        The point's full row is not stored; callers that need it index
+        their own copy of the data (Quadtree.data for built points).
+        
+        Args:
+            x: X coordinate
+            y: Y coordinate
+            index: Original index in dataset
+            
+        Returns:
+            True if insertion successful
+        """
+        if self.root is None or not self.root.insert(x, y, index):
+            return False
+        self.size += 1
+        self._flat = None  # Stale; query_range re-flattens on demand
+        return True
+    
+    def _bulk(self, node: QuadtreeNode, order: np.ndarray, start: int, end: int,
+              x_coords: np.ndarray, y_coords: np.ndarray, depth: int, leaves: List):
+        """
+        Recursively partition order[start:end] into the subtree rooted at node.
+        
+        Args:
+            node: Node covering the positions in order[start:end]
+            order: Permutation of point positions, reordered in place
+            start: First position of this node's slice
+            end: One past the last position of this node's slice
+            x_coords: X coordinates of all points
+            y_coords: Y coordinates of all points
+            depth: Depth of node (root is 1)
+            leaves: List to accumulate (leaf, start, end) tuples
+        """
+        if end - start <= self.capacity or depth >= self.max_depth:
+            if end > start:
+                leaves.append((node, start, end))
+            return
+        
+        x_mid, y_mid = node._make_children()
+        
+        # Same tie-breaking as contains(): NW, NE, SW, SE
+        pos = order[start:end]
+        west = x_coords[pos] <= x_mid
+        north = y_coords[pos] >= y_mid
+        parts = [pos[north & west], pos[north & ~west],
+                 pos[~north & west], pos[~north & ~west]]
+        
+        offset = start
+        for child, part in zip((node.nw, node.ne, node.sw, node.se), parts):
+            order[offset:offset + len(part)] = part
+            self._bulk(child, order, offset, offset + len(part),
+                       x_coords, y_coords, depth + 1, leaves)
+            offset += len(part)
     
     def query_range(self, x_range: Tuple[float, float], 
                    y_range: Tuple[float, float]) -> List[int]:
@@ -227,6 +514,15 @@ class Quadtree:
         if self.root is None:
             return []
         
+        # Inserts leave the flattened arrays stale (root.all_idxs is cleared too)
+        if self._flat is None or self.root.all_idxs is None:
+            self._flat = self._flatten()
+        
+        if self._range_kernel is not None:
+            # float32 query, matching how the vectorized leaf masks compare
+            q = np.array([x_range[0], x_range[1], y_range[0], y_range[1]], dtype=np.float32)
+            return self._range_kernel(*self._flat, q).tolist()
+        
         return self.root.query_range(x_range[0], x_range[1], 
                                      y_range[0], y_range[1])
     
@@ -249,16 +545,15 @@ class Quadtree:
     
     def get_depth(self) -> int:
         """Get the maximum depth of the tree."""
-        return self._get_depth_recursive(self.root)
-    
-    def _get_depth_recursive(self, node: Optional[QuadtreeNode]) -> int:
-        """Recursively calculate tree depth."""
-        if node is None or not node.is_divided:
+        if self.root is None:
             return 1
         
-        return 1 + max(
-            self._get_depth_recursive(node.nw),
-            self._get_depth_recursive(node.ne),
-            self._get_depth_recursive(node.sw),
-            self._get_depth_recursive(node.se)
-        )
+        max_depth = 0
+        stack = [(self.root, 1)]
+        while stack:
+            node, depth = stack.pop()
+            max_depth = max(max_depth, depth)
+            if node.is_divided:
+                stack.extend((child, depth + 1) for child in (node.nw, node.ne, node.sw, node.se))
+        
+        return max_depth
@@ -2,14 +2,45 @@
 Utility functions for loading and preprocessing the movies dataset.
 """
 
+import os
+import json
 import pandas as pd
 import numpy as np
 from typing import List, Tuple, Optional
 
 
+CATEGORICAL_COLUMNS = ['origin_country', 'original_language']
+
+
+def _convert_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Apply explicit column dtypes to the raw CSV frame.
+    
+    Args:
+        df: DataFrame as parsed from CSV
+        
+    Returns:
+        DataFrame with datetime release_date, categorical country/language
+        columns and float32 numerical columns
+    """
+    if 'release_date' in df.columns:
+        df['release_date'] = pd.to_datetime(df['release_date'], errors='coerce')
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    for column in df.select_dtypes(include='float64').columns:
+        df[column] = df[column].astype(np.float32)
+    return df
+
+
 def load_movies_dataset(filepath: str = "data_movies_clean.csv") -> pd.DataFrame:
     """
-    Load the movies dataset from Excel or CSV file.
+    Load the movies dataset from CSV or Parquet file.
+    
+    A CSV is converted once to a Parquet file next to it (same name,
+    .parquet extension) with explicit dtypes; later calls read the Parquet
+    copy as long as it is newer than the CSV. Without a usable Parquet engine
+    the CSV is read every time.
     
     Args:
         filepath: Path to the dataset file
@@ -18,7 +49,24 @@ def load_movies_dataset(filepath: str = "data_movies_clean.csv") -> pd.DataFrame
         DataFrame containing the movies dataset
     """
     try:
-        df = pd.read_csv(filepath)
+        parquet_path = os.path.splitext(filepath)[0] + '.parquet'
+        df = None
+        if filepath.endswith('.parquet'):
+            df = pd.read_parquet(filepath)
+        elif (os.path.exists(parquet_path) and
+              os.path.getmtime(parquet_path) >= os.path.getmtime(filepath)):
+            try:
+                df = pd.read_parquet(parquet_path)
+                filepath = parquet_path
+            except Exception as e:
+                print(f"Could not read Parquet copy of dataset, using CSV: {e}")
+        
+        if df is None:
+            df = _convert_dtypes(pd.read_csv(filepath))
+            try:
+                df.to_parquet(parquet_path, compression='zstd')
+            except Exception as e:
+                print(f"Could not write Parquet copy of dataset: {e}")
                     
         print(f"Loaded {len(df):,} movies from {filepath}")
         return df
@@ -58,7 +106,7 @@ def preprocess_data(df: pd.DataFrame,
     df_clean = df_clean[mask].reset_index(drop=True)
     
     # Extract numerical data as numpy array
-    data_array = df_clean[dimensions].values.astype(np.float64)
+    data_array = df_clean[dimensions].values.astype(np.float32, copy=False)
     
     print(f"Preprocessed {len(df_clean):,} valid movies")
     print(f"Dimensions used: {dimensions}")
@@ -66,6 +114,64 @@ def preprocess_data(df: pd.DataFrame,
     return data_array, df_clean
 
 
+def load_or_build(csv_path: str = "data_movies_clean.csv",
+                  cache_dir: str = ".cache",
+                  dimensions: Optional[List[str]] = None) -> Tuple[np.ndarray, pd.DataFrame]:
+    """
+    Load preprocessed data from cache, rebuilding it if stale.
+    
+    The cache holds the data array (data.npy, memory-mapped on load), the
+    cleaned DataFrame (df.parquet) and the dimensions they were built for
+    (dimensions.json). It is rebuilt whenever any file is missing, older
+    than the CSV, or was built for different dimensions.
+    
+    Args:
+        csv_path: Path to the dataset CSV
+        cache_dir: Directory holding the cached files
+        dimensions: List of numerical columns to use (default: all numerical dimensions)
+        
+    Returns:
+        Tuple of (processed_data_array, cleaned_dataframe)
+    """
+    if dimensions is None:
+        dimensions = ['budget', 'revenue', 'runtime', 'popularity', 'vote_average', 'vote_count']
+    
+    data_path = os.path.join(cache_dir, 'data.npy')
+    df_path = os.path.join(cache_dir, 'df.parquet')
+    dims_path = os.path.join(cache_dir, 'dimensions.json')
+    cache_files = (data_path, df_path, dims_path)
+    
+    source_mtime = os.path.getmtime(csv_path)
+    if all(os.path.exists(p) and os.path.getmtime(p) >= source_mtime for p in cache_files):
+        try:
+            with open(dims_path) as f:
+                cached_dimensions = json.load(f)
+            if cached_dimensions == list(dimensions):
+                data = np.load(data_path, mmap_mode='r')
+                df_clean = pd.read_parquet(df_path)
+                print(f"Loaded {len(df_clean):,} preprocessed movies from cache '{cache_dir}'")
+                return data, df_clean
+        except Exception as e:
+            print(f"Ignoring unreadable cache '{cache_dir}': {e}")
+    
+    df = load_movies_dataset(csv_path)
+    data, df_clean = preprocess_data(df, dimensions)
+    
+    # dimensions.json is written last, so a partly written cache is never used
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        if os.path.exists(dims_path):
+            os.remove(dims_path)
+        np.save(data_path, data)
+        df_clean.to_parquet(df_path)
+        with open(dims_path, 'w') as f:
+            json.dump(list(dimensions), f)
+    except Exception as e:
+        print(f"Could not write preprocessed data cache: {e}")
+    
+    return data, df_clean
+
+
 def normalize_data(data: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
     Normalize data to [0, 1] range for each dimension.
@@ -133,52 +239,109 @@ def get_sample_queries() -> dict:
     return queries
 
 
-def filter_by_metadata(df: pd.DataFrame, filters: dict) -> pd.DataFrame:
+def contains_mask(series: pd.Series, substrings: List[str]) -> np.ndarray:
     """
-    Filter DataFrame by categorical/metadata attributes.
+    Literal substring test over a text column.
+    
+    Missing values are stringified to '' once up front, then every row is
+    checked with plain `in` (no regex compilation, no per-row Series access).
+    
+    Args:
+        series: Column to scan
+        substrings: Substrings to look for (row matches if any is present)
+        
+    Returns:
+        Boolean array of length len(series)
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Test each category once and broadcast through the integer codes
+        categories = pd.Series(series.cat.categories.astype(str))
+        matches = np.append(contains_mask(categories, substrings), False)
+        return matches[series.cat.codes.to_numpy()]
+    
+    values = series.fillna('').astype(str).to_numpy()
+    if len(substrings) == 1:
+        sub = substrings[0]
+        return np.array([sub in s for s in values], dtype=bool)
+    return np.array([any(sub in s for sub in substrings) for s in values], dtype=bool)
+
+
+def metadata_mask(df: pd.DataFrame, filters: dict) -> np.ndarray:
+    """
+    Build a single boolean mask for categorical/metadata criteria.
+    
+    All criteria are combined with one in-place AND over NumPy arrays, so no
+    intermediate DataFrames are materialized.
     
     Args:
         df: DataFrame to filter
-        filters: Dictionary of filter criteria:
-            - 'release_date': tuple of (start_date, end_date) as strings
-            - 'origin_country': list of country codes or single code
-            - 'original_language': language code string or list
-            - Other categorical columns: value or list of values
+        filters: Dictionary of filter criteria (see filter_by_metadata)
             
     Returns:
-        Filtered DataFrame
+        Boolean array of length len(df), True for rows matching every criterion
     """
-    df_filtered = df.copy()
+    mask = np.ones(len(df), dtype=bool)
     
     for column, criteria in filters.items():
-        if column not in df_filtered.columns:
+        if column not in df.columns:
             continue
             
         if column == 'release_date':
             # Handle date range filtering
+            # Compare as int64 nanoseconds since epoch (NaT is the int64 minimum, never in range)
             start_date, end_date = criteria
-            df_filtered['release_date'] = pd.to_datetime(df_filtered['release_date'], errors='coerce')
-            df_filtered = df_filtered[
-                (df_filtered['release_date'] >= start_date) & 
-                (df_filtered['release_date'] <= end_date)
-            ]
+            dates = pd.to_datetime(df['release_date'], errors='coerce')
+            dates_ns = dates.to_numpy(dtype='datetime64[ns]').view(np.int64)
+            mask &= (dates_ns >= pd.Timestamp(start_date).value) & (dates_ns <= pd.Timestamp(end_date).value)
         elif column == 'origin_country':
             # Handle list column filtering (country can be in list)
             if isinstance(criteria, str):
                 criteria = [criteria]
-            # Filter rows where any of the criteria countries are in the origin_country list
-            mask = df_filtered[column].apply(
-                lambda x: any(country in str(x) for country in criteria) if pd.notna(x) else False
-            )
-            df_filtered = df_filtered[mask]
+            # Match rows where any of the criteria countries are in the origin_country list
+            mask &= contains_mask(df[column], criteria)
+        elif isinstance(df[column].dtype, pd.CategoricalDtype):
+            # Compare integer category codes instead of the values themselves
+            values = criteria if isinstance(criteria, list) else [criteria]
+            categories = df[column].cat.categories
+            codes = np.array([categories.get_loc(v) for v in values if v in categories],
+                             dtype=df[column].cat.codes.dtype)
+            column_codes = df[column].cat.codes.to_numpy()
+            if len(codes) == 1:
+                mask &= column_codes == codes[0]
+            else:
+                mask &= np.isin(column_codes, codes)
         elif isinstance(criteria, list):
             # Multiple values (OR condition)
-            df_filtered = df_filtered[df_filtered[column].isin(criteria)]
+            mask &= df[column].isin(criteria).to_numpy()
         else:
             # Single value
-            df_filtered = df_filtered[df_filtered[column] == criteria]
+            mask &= (df[column] == criteria).to_numpy()
+    
+    return mask
+
+
+def filter_by_metadata(df: pd.DataFrame, filters: dict) -> pd.DataFrame:
+    """
+    Filter DataFrame by categorical/metadata attributes.
+    
+    Args:
+        df: DataFrame to filter
+        filters: Dictionary of filter criteria:
+            - 'release_date': tuple of (start_date, end_date) as date strings,
+              Timestamps or int64 epoch nanoseconds
+            - 'origin_country': list of country codes or single code
+            - 'original_language': language code string or list
+            - Other categorical columns: value or list of values
+            
+    Returns:
+        Filtered DataFrame
+    """
+    df_filtered = df[metadata_mask(df, filters)].reset_index(drop=True)
+    
+    if 'release_date' in filters and 'release_date' in df_filtered.columns:
+        df_filtered['release_date'] = pd.to_datetime(df_filtered['release_date'], errors='coerce')
     
-    return df_filtered.reset_index(drop=True)
+    return df_filtered
 
 
 def parse_list_column(df: pd.DataFrame, column_name: str) -> pd.DataFrame: